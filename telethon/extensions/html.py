@@ -13,7 +13,7 @@ from ..tl.types import (
     MessageEntityPre, MessageEntityEmail, MessageEntityUrl,
     MessageEntityTextUrl, MessageEntityMentionName,
     MessageEntityUnderline, MessageEntityStrike, MessageEntityBlockquote,
-    MessageEntityCustomEmoji, TypeMessageEntity
+    MessageEntityCustomEmoji, MessageEntitySpoiler, TypeMessageEntity
 )
 
 
@@ -41,6 +41,8 @@ class HTMLToTelegramParser(HTMLParser):
             EntityType = MessageEntityUnderline
         elif tag == 'del' or tag == 's':
             EntityType = MessageEntityStrike
+        elif tag == 'spoiler':
+            EntityType = MessageEntitySpoiler
         elif tag == 'blockquote':
             EntityType = MessageEntityBlockquote
             if 'expandable' in attrs:
@@ -193,16 +195,21 @@ def unparse(text: str, entities: Iterable[TypeMessageEntity]) -> str:
             insert_at.append((e, -i, delimiter[1]))
 
     insert_at.sort(key=lambda t: (t[0], t[1]))
-    next_escape_bound = len(text)
+
+    # Collect the fragments right-to-left and join them once, instead of
+    # rebuilding the whole string for every insertion.
+    parts = []
+    prev = len(text)
     while insert_at:
         # Same logic as markdown.py
         at, _, what = insert_at.pop()
         while within_surrogate(text, at):
             at += 1
 
-        text = text[:at] + what + escape(text[at:next_escape_bound]) + text[next_escape_bound:]
-        next_escape_bound = at
-
-    text = escape(text[:next_escape_bound]) + text[next_escape_bound:]
+        parts.append(escape(text[at:prev]))
+        parts.append(what)
+        prev = at
 
-    return del_surrogate(text)
+    parts.append(escape(text[:prev]))
+    parts.reverse()
+    return del_surrogate(''.join(parts))
@@ -186,6 +186,11 @@ def unparse(text, entities, delimiters=None, url_fmt=None):
                 insert_at.append((e, -i, ']({})'.format(url)))
 
     insert_at.sort(key=lambda t: (t[0], t[1]))
+
+    # Collect the fragments right-to-left and join them once, instead of
+    # rebuilding the whole string for every insertion.
+    parts = []
+    prev = len(text)
     while insert_at:
         at, _, what = insert_at.pop()
 
@@ -196,6 +201,10 @@ def unparse(text, entities, delimiters=None, url_fmt=None):
         while within_surrogate(text, at):
             at += 1
 
-        text = text[:at] + what + text[at:]
+        parts.append(text[at:prev])
+        parts.append(what)
+        prev = at
 
-    return del_surrogate(text)
+    parts.append(text[:prev])
+    parts.reverse()
+    return del_surrogate(''.join(parts))
@@ -52,8 +52,32 @@ MARKDOWN_RE = re.compile(
 OPENING_TAG = "<{}>"
 CLOSING_TAG = "</{}>"
 URL_MARKUP = '<a href="{}">{}</a>'
-FIXED_WIDTH_DELIMS = [CODE_DELIM, PRE_DELIM]
-CODE_TAG_RE = re.compile(r"<code>.*?</code>")
+FIXED_WIDTH_DELIMS = frozenset((CODE_DELIM, PRE_DELIM))
+CODE_TAG_RE = re.compile(r"<code>[^<]*(?:<(?!/code>)[^<]*)*</code>")
+CODE_PLACEHOLDER_RE = re.compile(r"\x00C(\d+)\x00")
+
+# Ready-made HTML tags per delimiter, hoisted out of the parse loop.
+TAG_BY_DELIM = {
+    BOLD_DELIM: "b",
+    ITALIC_DELIM: "i",
+    UNDERLINE_DELIM: "u",
+    STRIKE_DELIM: "s",
+    CODE_DELIM: "code",
+    PRE_DELIM: "pre",
+    SPOILER_DELIM: "spoiler",
+}
+OPENING_TAGS = {d: OPENING_TAG.format(t) for d, t in TAG_BY_DELIM.items()}
+CLOSING_TAGS = {d: CLOSING_TAG.format(t) for d, t in TAG_BY_DELIM.items()}
+
+# Characters a MARKDOWN_RE match can start with; scanning for these with
+# a plain character class is much cheaper than running the alternation
+# at every position of a long, mostly-plain text.
+CANDIDATE_RE = re.compile(r"[*_\-~|`\[]")
+
+# A whole run of consecutive blockquote lines, including the newline
+# right after the run so the closing tag lands at the start of the
+# following line, as the old line loop did.
+BLOCKQUOTE_RUN_RE = re.compile(r"(?m)^(?:\*\*)?>.*(?:\n(?:\*\*)?>.*)*\n?")
 
 
 class Markdown:
@@ -62,64 +86,88 @@ class Markdown:
 
     @staticmethod
     def blockquote_parser(text):
-        text = re.sub(r"\n&gt;", "\n>", re.sub(r"^&gt;", ">", text))
-        lines = text.split("\n")
-        result = []
-
-        in_blockquote = False
-
-        for line in lines:
-            if line.startswith(BLOCKQUOTE_DELIM):
-                if not in_blockquote:
-                    line = re.sub(r"^> ", OPENING_TAG.format("blockquote"), line)
-                    line = re.sub(r"^>", OPENING_TAG.format("blockquote"), line)
-                    in_blockquote = True
-                    result.append(line.strip())
-                else:
-                    result.append(line[1:].strip())
-            elif line.startswith(BLOCKQUOTE_EXPANDABLE_DELIM):
-                if not in_blockquote:
-                    line = re.sub(
-                        r"^\*\*> ", OPENING_TAG.format("blockquote expandable"), line
-                    )
-                    line = re.sub(
-                        r"^\*\*>", OPENING_TAG.format("blockquote expandable"), line
-                    )
-                    in_blockquote = True
-                    result.append(line.strip())
-                else:
-                    result.append(line[3:].strip())
+        if text.startswith("&gt;"):
+            text = ">" + text[len("&gt;"):]
+        text = text.replace("\n&gt;", "\n>")
+
+        # Fast path: typical messages contain no blockquote at all.
+        if BLOCKQUOTE_DELIM not in text:
+            return text
+
+        def replace(match):
+            block = match.group(0)
+            trailing_newline = block.endswith("\n")
+            if trailing_newline:
+                block = block[:-1]
+
+            lines = block.split("\n")
+            first = lines[0]
+            if first[:1] == BLOCKQUOTE_DELIM:
+                tag = OPENING_TAG.format("blockquote")
+                content = first[2:] if first[:2] == "> " else first[1:]
             else:
-                if in_blockquote:
-                    line = CLOSING_TAG.format("blockquote") + line
-                    in_blockquote = False
-                result.append(line)
+                tag = OPENING_TAG.format("blockquote expandable")
+                content = first[4:] if first[:4] == "**> " else first[3:]
+
+            out = [(tag + content).strip()]
+            for line in lines[1:]:
+                out.append(
+                    (line[1:] if line[:1] == BLOCKQUOTE_DELIM
+                     else line[3:]).strip()
+                )
 
-        if in_blockquote:
-            line = result[len(result) - 1] + CLOSING_TAG.format("blockquote")
-            result.pop(len(result) - 1)
-            result.append(line)
+            closing = CLOSING_TAG.format("blockquote")
+            if trailing_newline:
+                closing = "\n" + closing
+            return "\n".join(out) + closing
 
-        return "\n".join(result)
+        return BLOCKQUOTE_RUN_RE.sub(replace, text)
 
     def parse(self, text: str, strict: bool = False):
         if strict:
             text = html.escape(text)
         text = self.blockquote_parser(text)
 
+        # Fast path: no delimiter characters at all (the common case for
+        # chat messages), so hand straight over to the HTML parser.
+        if not CANDIDATE_RE.search(text):
+            return self.html.parse(text)
+
         delims = set()
         is_fixed_width = False
 
-        placeholders = {}
-        for i, code_section in enumerate(CODE_TAG_RE.findall(text)):
-            placeholder = f"{{CODE_SECTION_{i}}}"
-            placeholders[placeholder] = code_section
-            text = text.replace(code_section, placeholder, 1)
+        # Stash every <code> section behind a NUL-delimited sentinel in a
+        # single pass; a str.replace per section would rescan the whole
+        # text each time.
+        code_sections = []
+
+        def stash(match):
+            code_sections.append(match.group(0))
+            return f"\x00C{len(code_sections) - 1}\x00"
+
+        text = CODE_TAG_RE.sub(stash, text)
+
+        # Collect the rewritten text into a fragment list while walking
+        # the matches with a cursor, so the original match offsets stay
+        # valid throughout and the string is never respliced per match.
+        parts = []
+        last = 0
+        # Furthest position already examined by a full match; candidates
+        # before it were part of an earlier (possibly skipped) match.
+        pos = 0
+
+        for candidate in CANDIDATE_RE.finditer(text):
+            start = candidate.start()
+            if start < pos or start < last:
+                continue
+
+            match = MARKDOWN_RE.match(text, start)
+            if match is None:
+                continue
+            end = match.end()
+            pos = end
 
-        for i, match in enumerate(re.finditer(MARKDOWN_RE, text)):
-            start, _ = match.span()
             delim, text_url, url = match.groups()
-            full = match.group(0)
 
             if delim in FIXED_WIDTH_DELIMS:
                 is_fixed_width = not is_fixed_width
@@ -128,53 +176,56 @@ class Markdown:
                 continue
 
             if text_url:
-                text = utils.replace_once(
-                    text, full, URL_MARKUP.format(url, text_url), start
-                )
+                parts.append(text[last:start])
+                parts.append(URL_MARKUP.format(url, text_url))
+                last = end
                 continue
 
-            if delim == BOLD_DELIM:
-                tag = "b"
-            elif delim == ITALIC_DELIM:
-                tag = "i"
-            elif delim == UNDERLINE_DELIM:
-                tag = "u"
-            elif delim == STRIKE_DELIM:
-                tag = "s"
-            elif delim == CODE_DELIM:
-                tag = "code"
-            elif delim == PRE_DELIM:
-                tag = "pre"
-            elif delim == SPOILER_DELIM:
-                tag = "spoiler"
-            else:
+            if delim not in TAG_BY_DELIM:
                 continue
 
+            parts.append(text[last:start])
+            last = end
+
             if delim not in delims:
                 delims.add(delim)
-                tag = OPENING_TAG.format(tag)
+                if delim == PRE_DELIM:
+                    language = text[end:].split("\n", 1)[0]
+                    parts.append(f'<pre language="{language}">')
+                    last = end + len(language)
+                else:
+                    parts.append(OPENING_TAGS[delim])
             else:
                 delims.remove(delim)
-                tag = CLOSING_TAG.format(tag)
+                parts.append(CLOSING_TAGS[delim])
 
-            if delim == PRE_DELIM and delim in delims:
-                delim_and_language = text[text.find(PRE_DELIM) :].split("\n")[0]
-                language = delim_and_language[len(PRE_DELIM) :]
-                text = utils.replace_once(
-                    text, delim_and_language, f'<pre language="{language}">', start
-                )
-                continue
+        parts.append(text[last:])
+        text = "".join(parts)
 
-            text = utils.replace_once(text, delim, tag, start)
+        if code_sections:
+            def restore(match):
+                index = int(match.group(1))
+                if index < len(code_sections):
+                    return code_sections[index]
+                # Not one of our sentinels: the text itself contained a
+                # NUL-delimited sequence; leave it untouched.
+                return match.group(0)
 
-        for placeholder, code_section in placeholders.items():
-            text = text.replace(placeholder, code_section)
+            text = CODE_PLACEHOLDER_RE.sub(restore, text)
 
         return self.html.parse(text)
 
     @staticmethod
     def unparse(text: str, entities: list):
-        text = utils.add_surrogates(text)
+        if not entities:
+            return text
+
+        # ASCII text contains no astral code points, so entity offsets
+        # already line up with string indices and the surrogate
+        # round-trip (two full-string conversions) can be skipped.
+        need_surrogates = not text.isascii()
+        if need_surrogates:
+            text = utils.add_surrogates(text)
 
         entities_offsets = []
 
@@ -259,7 +310,16 @@ class Markdown:
             ),
         )
 
+        # Walk the string once, collecting fragments right-to-left, instead
+        # of rebuilding the whole string for every insertion (O(n*L)).
+        parts = []
+        prev = len(text)
         for entity, offset in entities_offsets:
-            text = text[:offset] + entity + text[offset:]
-
-        return utils.remove_surrogates(text)
+            parts.append(text[offset:prev])
+            parts.append(entity)
+            prev = offset
+        parts.append(text[:prev])
+        parts.reverse()
+        text = "".join(parts)
+
+        return utils.remove_surrogates(text) if need_surrogates else text
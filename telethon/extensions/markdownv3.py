@@ -1,4 +1,3 @@
-import html
 import re
 from . import utils, html as htmlparser
 from ..tl import types
@@ -34,7 +33,59 @@ MARKDOWN_RE = re.compile(
     )
 )
 
-CODE_TAG_RE = re.compile(r"<code>.*?</code>")
+CODE_TAG_RE = re.compile(r"<code>[^<]*(?:<(?!/code>)[^<]*)*</code>")
+
+# First characters of every markdown token; messages without any of
+# these can skip the parse loop entirely.
+DELIM_CHARS = frozenset("*_-~|`[")
+
+# A whole run of consecutive blockquote lines, and the per-line prefix
+# (plus the whitespace after it) to strip from such a run.
+BLOCKQUOTE_RE = re.compile(r"(?m)^(\*\*>|>).*(?:\n(?:\*\*>|>).*)*")
+BLOCKQUOTE_STRIP_RE = re.compile(r"(?m)^(?:\*\*>|>)[^\S\n]*")
+
+# Ready-made HTML tags per delimiter, hoisted out of the parse loop.
+OPENING_TAGS = {
+    BOLD_DELIM: "<b>",
+    ITALIC_DELIM: "<i>",
+    UNDERLINE_DELIM: "<u>",
+    STRIKE_DELIM: "<s>",
+    CODE_DELIM: "<code>",
+    PRE_DELIM: "<pre>",
+    SPOILER_DELIM: "<spoiler>",
+}
+CLOSING_TAGS = {
+    BOLD_DELIM: "</b>",
+    ITALIC_DELIM: "</i>",
+    UNDERLINE_DELIM: "</u>",
+    STRIKE_DELIM: "</s>",
+    CODE_DELIM: "</code>",
+    PRE_DELIM: "</pre>",
+    SPOILER_DELIM: "</spoiler>",
+}
+
+# Single-pass pattern: protected <code> sections, markdown delimiters and
+# inline links, tried in that order.
+PARSE_RE = re.compile(
+    r"({c})|{m}".format(c=CODE_TAG_RE.pattern, m=MARKDOWN_RE.pattern)
+)
+
+# Characters a PARSE_RE match can start with; scanning for these with a
+# plain character class is much cheaper than running the alternation at
+# every position of a long, mostly-plain text.
+CANDIDATE_RE = re.compile(r"[<*_\-~|`\[]")
+
+# Entity types wrapped by the same delimiter on both sides, keyed by type
+# for O(1) dispatch in unparse; the remaining entity types need dynamic
+# tags and are handled separately.
+ENTITY_DELIMS = {
+    types.MessageEntityBold: BOLD_DELIM,
+    types.MessageEntityItalic: ITALIC_DELIM,
+    types.MessageEntityUnderline: UNDERLINE_DELIM,
+    types.MessageEntityStrike: STRIKE_DELIM,
+    types.MessageEntityCode: CODE_DELIM,
+    types.MessageEntitySpoiler: SPOILER_DELIM,
+}
 
 
 class MarkdownV3:
@@ -46,45 +97,20 @@ class MarkdownV3:
         if not text:
             return ""
 
-        lines = text.split("\n")
-        result = []
-        in_blockquote = False
-        is_expandable = False
-
-        for line in lines:
-            if (
-                line.startswith(BLOCKQUOTE_EXPANDABLE_DELIM)
-                or line.startswith(BLOCKQUOTE_DELIM)
-            ):
-                current_expandable = line.startswith(BLOCKQUOTE_EXPANDABLE_DELIM)
-                prefix = (
-                    BLOCKQUOTE_EXPANDABLE_DELIM
-                    if current_expandable
-                    else BLOCKQUOTE_DELIM
-                )
-                content = line[len(prefix):].lstrip()
-
-                if not in_blockquote:
-                    tag = (
-                        "blockquote expandable"
-                        if current_expandable
-                        else "blockquote"
-                    )
-                    result.append(f"<{tag}>{content}")
-                    in_blockquote = True
-                    is_expandable = current_expandable
-                else:
-                    result.append(content)
-            else:
-                if in_blockquote:
-                    result[-1] += "</blockquote>"
-                    in_blockquote = False
-                result.append(line)
+        # Fast path: typical messages contain no blockquote at all.
+        if BLOCKQUOTE_DELIM not in text:
+            return text
 
-        if in_blockquote and result:
-            result[-1] += "</blockquote>"
+        def replace(match):
+            tag = (
+                "blockquote expandable"
+                if match.group(1) == BLOCKQUOTE_EXPANDABLE_DELIM
+                else "blockquote"
+            )
+            content = BLOCKQUOTE_STRIP_RE.sub("", match.group(0))
+            return f"<{tag}>{content}</blockquote>"
 
-        return "\n".join(result)
+        return BLOCKQUOTE_RE.sub(replace, text)
 
     def parse(self, text: str):
         if not text:
@@ -93,113 +119,102 @@ class MarkdownV3:
         # 1. Handle blockquotes
         text = self.blockquote_parser(text)
 
-        # 2. Protect existing code sections
-        placeholders = {}
-        code_matches = list(CODE_TAG_RE.finditer(text))
-        for i, m in enumerate(reversed(code_matches)):
-            placeholder = f"{{CODE_SECTION_{i}}}"
-            placeholders[placeholder] = m.group(0)
-            text = text[:m.start()] + placeholder + text[m.end():]
+        # Fast path: no delimiter characters at all (the common case for
+        # chat messages), so hand straight over to the HTML parser.
+        if DELIM_CHARS.isdisjoint(text):
+            return self.html.parse(text)
 
-        # 3. Parse delimiters (reverse order to keep offsets valid)
+        # 2. Rewrite code sections, links and delimiters in a single pass.
+        # Code sections pass through verbatim, so no placeholder dance is
+        # needed, and the output is collected into one fragment list.
         delims = {}
-        matches = list(MARKDOWN_RE.finditer(text))
-
-        for match in reversed(matches):
-            start, end = match.span()
-            delim, text_url, url = match.groups()
+        parts = []
+        last = 0
 
-            if text_url:
-                replacement = f'<a href="{url}">{text_url}</a>'
-                text = text[:start] + replacement + text[end:]
+        for candidate in CANDIDATE_RE.finditer(text):
+            start = candidate.start()
+            if start < last:
+                # Inside a previous match or its consumed ```language line
                 continue
 
-            tag_map = {
-                BOLD_DELIM: "b",
-                ITALIC_DELIM: "i",
-                UNDERLINE_DELIM: "u",
-                STRIKE_DELIM: "s",
-                CODE_DELIM: "code",
-                PRE_DELIM: "pre",
-                SPOILER_DELIM: "spoiler",
-            }
-
-            if delim not in tag_map:
+            match = PARSE_RE.match(text, start)
+            if match is None:
                 continue
+            end = match.end()
 
-            tag = tag_map[delim]
-            count = delims.get(delim, 0)
+            code, delim, text_url, url = match.groups()
+            parts.append(text[last:start])
+            last = end
 
-            if count % 2 == 0:
-                tag_str = f"</{tag}>"
-            else:
-                if delim == PRE_DELIM:
-                    line_part = text[end:].split("\n")[0]
-                    tag_str = f'<pre language="{line_part}">'
-                    text = text[:end] + text[end + len(line_part):]
-                else:
-                    tag_str = f"<{tag}>"
+            if code:
+                parts.append(code)
+                continue
 
-            delims[delim] = count + 1
-            text = text[:start] + tag_str + text[end:]
-
-        # Restore code placeholders
-        for placeholder, code_section in placeholders.items():
-            text = text.replace(placeholder, code_section)
-
-        # 4. Convert HTML to entities
-        clean_text, entities = self.html.parse(text)
-
-        # 5. Post-process custom emojis and spoilers
-        for i, e in enumerate(entities):
-            if isinstance(e, types.MessageEntityTextUrl):
-                if e.url == "spoiler":
-                    entities[i] = types.MessageEntitySpoiler(
-                        e.offset, e.length
-                    )
-                elif e.url.startswith("emoji/"):
+            if text_url:
+                # Spoiler and custom-emoji links become their dedicated
+                # tags right away, so no second pass over the entities is
+                # needed to fix up the resulting text URLs.
+                if url == "spoiler":
+                    parts.append(f"<spoiler>{text_url}</spoiler>")
+                    continue
+                if url.startswith("emoji/"):
                     try:
-                        eid = int(e.url.split("/")[1])
-                        entities[i] = types.MessageEntityCustomEmoji(
-                            e.offset, e.length, eid
-                        )
+                        emoji_id = int(url.split("/")[1])
                     except (IndexError, ValueError):
+                        pass
+                    else:
+                        parts.append(
+                            f'<tg-emoji emoji-id="{emoji_id}">'
+                            f"{text_url}</tg-emoji>"
+                        )
                         continue
+                parts.append(f'<a href="{url}">{text_url}</a>')
+                continue
 
-        return clean_text, entities
+            count = delims.get(delim, 0)
+            delims[delim] = count + 1
+
+            if count % 2 != 0:
+                parts.append(CLOSING_TAGS[delim])
+            elif delim == PRE_DELIM:
+                language = text[end:].split("\n", 1)[0]
+                parts.append(f'<pre language="{language}">')
+                last = end + len(language)
+            else:
+                parts.append(OPENING_TAGS[delim])
+
+        parts.append(text[last:])
+        text = "".join(parts)
+
+        # 3. Convert HTML to entities
+        return self.html.parse(text)
 
     def unparse(self, text: str, entities: list):
         if not text:
             return ""
+        if not entities:
+            return text
+
+        # ASCII text contains no astral code points, so entity offsets
+        # already line up with string indices and the surrogate
+        # round-trip (two full-string conversions) can be skipped.
+        need_surrogates = not text.isascii()
+        if need_surrogates:
+            text = utils.add_surrogates(text)
 
-        text = utils.add_surrogates(text)
         insertions = []
 
         for entity in (entities or []):
             start = entity.offset
             end = start + entity.length
 
-            if isinstance(entity, types.MessageEntityCustomEmoji):
+            delim = ENTITY_DELIMS.get(type(entity))
+            if delim is not None:
+                insertions.append((start, delim))
+                insertions.append((end, delim))
+            elif isinstance(entity, types.MessageEntityCustomEmoji):
                 insertions.append((start, "["))
                 insertions.append((end, f"](emoji/{entity.document_id})"))
-            elif isinstance(entity, types.MessageEntitySpoiler):
-                insertions.append((start, SPOILER_DELIM))
-                insertions.append((end, SPOILER_DELIM))
-            elif isinstance(entity, types.MessageEntityBold):
-                insertions.append((start, BOLD_DELIM))
-                insertions.append((end, BOLD_DELIM))
-            elif isinstance(entity, types.MessageEntityItalic):
-                insertions.append((start, ITALIC_DELIM))
-                insertions.append((end, ITALIC_DELIM))
-            elif isinstance(entity, types.MessageEntityUnderline):
-                insertions.append((start, UNDERLINE_DELIM))
-                insertions.append((end, UNDERLINE_DELIM))
-            elif isinstance(entity, types.MessageEntityStrike):
-                insertions.append((start, STRIKE_DELIM))
-                insertions.append((end, STRIKE_DELIM))
-            elif isinstance(entity, types.MessageEntityCode):
-                insertions.append((start, CODE_DELIM))
-                insertions.append((end, CODE_DELIM))
             elif isinstance(entity, types.MessageEntityPre):
                 lang = getattr(entity, "language", "") or ""
                 insertions.append((start, f"{PRE_DELIM}{lang}\n"))
@@ -222,7 +237,16 @@ class MarkdownV3:
 
         insertions.sort(key=lambda x: x[0], reverse=True)
 
+        # Walk the string once, collecting fragments right-to-left, instead
+        # of rebuilding the whole string for every insertion (O(n*L)).
+        parts = []
+        prev = len(text)
         for offset, tag in insertions:
-            text = text[:offset] + tag + text[offset:]
-
-        return utils.remove_surrogates(text)
+            parts.append(text[offset:prev])
+            parts.append(tag)
+            prev = offset
+        parts.append(text[:prev])
+        parts.reverse()
+        text = "".join(parts)
+
+        return utils.remove_surrogates(text) if need_surrogates else text
@@ -0,0 +1,26 @@
+"""
+Tests for `telethon.extensions.markdownv2`.
+"""
+from telethon.extensions.markdownv2 import Markdown
+from telethon.tl.types import MessageEntityBold, MessageEntityCode
+
+
+def test_nul_sentinel_collision():
+    """
+    Test that text which itself contains a NUL-delimited sequence like
+    the internal code-section sentinels doesn't crash the restore step
+    and comes through unchanged.
+    """
+    text, entities = Markdown().parse('**bold** <code>x</code>\n\x00C7\x00')
+    assert text == 'bold x\n\x00C7\x00'
+    assert entities == [MessageEntityBold(0, 4), MessageEntityCode(5, 1)]
+
+
+def test_nul_sequence_without_code():
+    """
+    Same as above, but with no <code> section at all, so the restore
+    step is skipped entirely.
+    """
+    text, entities = Markdown().parse('no code here \x00C7\x00')
+    assert text == 'no code here \x00C7\x00'
+    assert entities == []